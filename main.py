@@ -2,14 +2,21 @@ import os
 import re
 import sqlite3
 import asyncio
-from contextlib import closing
+import atexit
+import functools
+import threading
+import time
+from contextlib import contextmanager
 from datetime import timedelta
-from typing import Optional, Set, Dict, Any
+from types import MappingProxyType
+from typing import AbstractSet, Optional, Set, Dict, Any, Iterator, List, Mapping, Tuple, FrozenSet
 
 from telegram import Update
-from telegram.constants import ChatMemberStatus
+from telegram.constants import ChatMemberStatus, ChatType
+from telegram.error import BadRequest, NetworkError, RetryAfter
 from telegram.ext import (
     ApplicationBuilder,
+    ChatMemberHandler,
     CommandHandler,
     MessageHandler,
     ContextTypes,
@@ -35,9 +42,87 @@ DEFAULT_TYPES: Set[str] = set(
 
 VALID_TYPES: Set[str] = {"photo", "video", "document", "voice", "sticker", "animation", "video_note"}
 
+# Bit per media type; group_settings.media_types_mask stores the OR of enabled types
+TYPE_BITS: Dict[str, int] = {
+    "photo": 1,
+    "video": 2,
+    "document": 4,
+    "voice": 8,
+    "sticker": 16,
+    "animation": 32,
+    "video_note": 64,
+}
+
+# Per-process cache of group settings. The bot is the only writer, so
+# schedule_save keeps it coherent without a TTL.
+_SETTINGS_CACHE: Dict[int, Mapping[str, Any]] = {}
+
+# Admin commands arriving within this window of a chat's last write are
+# buffered and written together in one transaction.
+SAVE_DEBOUNCE = 2.0  # seconds
+_PENDING_SAVES: Dict[int, Tuple[int, bool, bool, AbstractSet[str]]] = {}
+_LAST_SAVE_AT: Dict[int, float] = {}
+
+_RE_UNIT = re.compile(r"(\d+)([mhd])")
+_UNIT_MULT = {"m": 60, "h": 3600, "d": 86400}
+
+# How often the expiry sweeper looks for messages whose TTL has passed
+SWEEP_INTERVAL = 5  # seconds
+# How often the WAL is checkpointed and query planner stats refreshed
+DB_MAINTENANCE_INTERVAL = 3600  # seconds
+# Telegram's deleteMessages accepts at most 100 message ids per call
+DELETE_BATCH_SIZE = 100
+
+_sweep_in_flight = False
+
+# chat_id -> (admin user ids, fetched_at). One get_chat_administrators call
+# covers every sender in the chat until the entry goes stale.
+ADMIN_CACHE_TTL = 300  # seconds
+_ADMIN_SET: Dict[int, Tuple[FrozenSet[int], float]] = {}
+# getChatAdministrators leaves out bots, so admin bots are checked with
+# get_chat_member and cached per (chat_id, user_id) instead.
+_BOT_ADMIN_CACHE: Dict[Tuple[int, int], Tuple[bool, float]] = {}
+_ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+
+# One long-lived connection for the whole process (autocommit mode, so
+# transactions are explicit). _DB_LOCK serializes access across threads.
+_CONN: Optional[sqlite3.Connection] = None
+_DB_LOCK = threading.Lock()
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _CONN
+    if _CONN is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        # Wait instead of failing with "database is locked" under concurrent access
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        _CONN = conn
+    return _CONN
+
+
+@contextmanager
+def _write_txn() -> Iterator[sqlite3.Connection]:
+    """Run the block as one BEGIN IMMEDIATE ... COMMIT on the shared connection."""
+    with _DB_LOCK:
+        conn = _get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
 
 def init_db() -> None:
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with _DB_LOCK:
+        conn = _get_conn()
+        # WAL is persistent in the db file; it doesn't apply to in-memory databases
+        if DB_PATH != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS group_settings (
@@ -49,50 +134,284 @@ def init_db() -> None:
             )
             """
         )
-        conn.commit()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pending_deletions (
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                delete_at INTEGER NOT NULL,
+                PRIMARY KEY (chat_id, message_id)
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pending_deletions_delete_at ON pending_deletions (delete_at)"
+        )
+
+        # Migration: databases created before media_types_mask existed
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(group_settings)")}
+        if "media_types_mask" not in columns:
+            conn.execute("ALTER TABLE group_settings ADD COLUMN media_types_mask INTEGER")
+        legacy = conn.execute(
+            "SELECT chat_id, media_types FROM group_settings WHERE media_types_mask IS NULL"
+        ).fetchall()
+
+    if legacy:
+        with _write_txn() as conn:
+            conn.executemany(
+                "UPDATE group_settings SET media_types_mask=? WHERE chat_id=?",
+                [(types_to_mask(_split_types(media_types)), chat_id) for chat_id, media_types in legacy],
+            )
+
+
+def checkpoint_db(mode: str = "PASSIVE") -> None:
+    """Fold the WAL back into the main db file so it doesn't grow unbounded."""
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"bad checkpoint mode: {mode}")
+    with _DB_LOCK:
+        conn = _get_conn()
+        conn.execute(f"PRAGMA wal_checkpoint({mode})")
+        conn.execute("PRAGMA optimize")
+
+
+def close_db() -> None:
+    global _CONN
+    if _CONN is None:
+        return
+    flush_pending_saves()
+    checkpoint_db("FULL")
+    with _DB_LOCK:
+        _CONN.close()
+        _CONN = None
+
+
+def _split_types(media_types: Optional[str]) -> Set[str]:
+    return set(t.strip() for t in (media_types or "").split(",") if t.strip())
+
+
+def types_to_mask(types: AbstractSet[str]) -> int:
+    mask = 0
+    for t in types:
+        mask |= TYPE_BITS.get(t, 0)
+    return mask
+
+
+@functools.lru_cache(maxsize=256)
+def mask_to_types(mask: int) -> FrozenSet[str]:
+    # Only 2**len(TYPE_BITS) masks exist; frozenset makes the cached value safe to share
+    return frozenset(t for t, bit in TYPE_BITS.items() if mask & bit)
+
+
+_DEFAULT_SETTINGS: Mapping[str, Any] = MappingProxyType({
+    "ttl": DEFAULT_TTL,
+    "enabled": DEFAULT_ENABLED,
+    "delete_admins": DEFAULT_DELETE_ADMINS,
+    "types": mask_to_types(types_to_mask(DEFAULT_TYPES)),
+    "mask": types_to_mask(DEFAULT_TYPES),
+})
 
 
-def get_settings(chat_id: int) -> Dict[str, Any]:
-    with closing(sqlite3.connect(DB_PATH)) as conn:
-        row = conn.execute(
-            "SELECT ttl_seconds, enabled, delete_admins, media_types FROM group_settings WHERE chat_id=?",
+def get_settings(chat_id: int) -> Mapping[str, Any]:
+    cached = _SETTINGS_CACHE.get(chat_id)
+    if cached is not None:
+        return cached
+
+    with _DB_LOCK:
+        row = _get_conn().execute(
+            "SELECT ttl_seconds, enabled, delete_admins, media_types_mask FROM group_settings WHERE chat_id=?",
             (chat_id,),
         ).fetchone()
 
     if not row:
-        return {
-            "ttl": DEFAULT_TTL,
-            "enabled": DEFAULT_ENABLED,
-            "delete_admins": DEFAULT_DELETE_ADMINS,
-            "types": set(DEFAULT_TYPES),
+        # Unconfigured chats all share one read-only defaults object
+        settings = _DEFAULT_SETTINGS
+    else:
+        ttl, enabled, delete_admins, mask = row
+        settings = {
+            "ttl": int(ttl),
+            "enabled": bool(enabled),
+            "delete_admins": bool(delete_admins),
+            "types": mask_to_types(mask),
+            "mask": int(mask),
         }
 
-    ttl, enabled, delete_admins, media_types = row
-    types = set(t.strip() for t in (media_types or "").split(",") if t.strip())
-    return {
-        "ttl": int(ttl),
-        "enabled": bool(enabled),
-        "delete_admins": bool(delete_admins),
-        "types": types,
-    }
+    # The read may have run in a worker thread while a newer value was cached;
+    # never let a DB load replace it
+    return _SETTINGS_CACHE.setdefault(chat_id, settings)
 
 
-def save_settings(chat_id: int, ttl: int, enabled: bool, delete_admins: bool, types: Set[str]) -> None:
+def _write_settings(chat_id: int, ttl: int, enabled: bool, delete_admins: bool, types: AbstractSet[str]) -> None:
     types_str = ",".join(sorted(types))
-    with closing(sqlite3.connect(DB_PATH)) as conn:
+    with _write_txn() as conn:
         conn.execute(
             """
-            INSERT INTO group_settings (chat_id, ttl_seconds, enabled, delete_admins, media_types)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO group_settings (chat_id, ttl_seconds, enabled, delete_admins, media_types, media_types_mask)
+            VALUES (?, ?, ?, ?, ?, ?)
             ON CONFLICT(chat_id) DO UPDATE SET
                 ttl_seconds=excluded.ttl_seconds,
                 enabled=excluded.enabled,
                 delete_admins=excluded.delete_admins,
-                media_types=excluded.media_types
+                media_types=excluded.media_types,
+                media_types_mask=excluded.media_types_mask
             """,
-            (chat_id, int(ttl), int(enabled), int(delete_admins), types_str),
+            (chat_id, int(ttl), int(enabled), int(delete_admins), types_str, types_to_mask(types)),
         )
-        conn.commit()
+
+
+def _cache_settings(chat_id: int, ttl: int, enabled: bool, delete_admins: bool, types: AbstractSet[str]) -> None:
+    mask = types_to_mask(types)
+    _SETTINGS_CACHE[chat_id] = {
+        "ttl": int(ttl),
+        "enabled": bool(enabled),
+        "delete_admins": bool(delete_admins),
+        "types": mask_to_types(mask),
+        "mask": mask,
+    }
+
+
+def flush_pending_saves(chat_id: Optional[int] = None) -> None:
+    """Write out buffered schedule_save() calls (one chat, or all) immediately."""
+    chat_ids = list(_PENDING_SAVES) if chat_id is None else [chat_id]
+    for cid in chat_ids:
+        args = _PENDING_SAVES.get(cid)
+        if args is None:
+            continue
+        _write_settings(cid, *args)
+        del _PENDING_SAVES[cid]
+
+
+async def _run_blocking(func, *args):
+    # asyncio.to_thread is 3.9+; run_in_executor keeps Python 3.8 support
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
+
+
+async def aget_settings(chat_id: int) -> Mapping[str, Any]:
+    cached = _SETTINGS_CACHE.get(chat_id)
+    if cached is not None:
+        return cached
+    return await _run_blocking(get_settings, chat_id)
+
+
+async def schedule_save(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    ttl: int,
+    enabled: bool,
+    delete_admins: bool,
+    types: AbstractSet[str],
+) -> None:
+    """
+    Debounced settings write. The cache is updated right away; the DB write
+    happens now if the chat hasn't been written in the last SAVE_DEBOUNCE
+    seconds, otherwise it is buffered and flushed once when the window ends,
+    so a burst of admin commands costs at most two commits.
+    """
+    args = (ttl, enabled, delete_admins, types)
+    _cache_settings(chat_id, *args)
+
+    if chat_id in _PENDING_SAVES:
+        # A flush is already scheduled; it will pick up the latest values
+        _PENDING_SAVES[chat_id] = args
+        return
+
+    now = time.monotonic()
+    last = _LAST_SAVE_AT.get(chat_id)
+    if last is None or now - last >= SAVE_DEBOUNCE:
+        _LAST_SAVE_AT[chat_id] = now
+        try:
+            await _run_blocking(_write_settings, chat_id, *args)
+            return
+        except sqlite3.Error:
+            # e.g. "database is locked"; the cache already has the new value,
+            # so buffer the write and let flush_settings retry it
+            pass
+
+    _PENDING_SAVES[chat_id] = args
+    context.job_queue.run_once(flush_settings, when=SAVE_DEBOUNCE, data=chat_id)
+
+
+async def flush_settings(context: ContextTypes.DEFAULT_TYPE) -> None:
+    chat_id = context.job.data
+    args = _PENDING_SAVES.get(chat_id)
+    if args is None:
+        return
+    try:
+        await _run_blocking(_write_settings, chat_id, *args)
+    except sqlite3.Error:
+        # Keep the change buffered and try again later instead of losing it
+        context.job_queue.run_once(flush_settings, when=SAVE_DEBOUNCE, data=chat_id)
+        raise
+    _LAST_SAVE_AT[chat_id] = time.monotonic()
+
+    if _PENDING_SAVES.get(chat_id) is args:
+        del _PENDING_SAVES[chat_id]
+    else:
+        # Changed again while we were writing; that value needs its own flush
+        context.job_queue.run_once(flush_settings, when=SAVE_DEBOUNCE, data=chat_id)
+
+
+def cache_bust(chat_id: Optional[int] = None) -> None:
+    """Drop cached settings for one chat (or all chats if chat_id is None)."""
+    # The DB lags the cache while a save is buffered; write it out first so
+    # the reload doesn't bring back the old row
+    flush_pending_saves(chat_id)
+    if chat_id is None:
+        _SETTINGS_CACHE.clear()
+    else:
+        _SETTINGS_CACHE.pop(chat_id, None)
+
+
+def add_pending_deletion(chat_id: int, message_id: int, delete_at: int) -> None:
+    with _write_txn() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO pending_deletions (chat_id, message_id, delete_at) VALUES (?, ?, ?)",
+            (chat_id, message_id, int(delete_at)),
+        )
+
+
+def get_due_deletions(now: int) -> List[Tuple[int, int]]:
+    with _DB_LOCK:
+        return _get_conn().execute(
+            "SELECT chat_id, message_id FROM pending_deletions WHERE delete_at<=? ORDER BY delete_at",
+            (int(now),),
+        ).fetchall()
+
+
+def remove_pending_deletions(rows: List[Tuple[int, int]]) -> None:
+    with _write_txn() as conn:
+        conn.executemany(
+            "DELETE FROM pending_deletions WHERE chat_id=? AND message_id=?",
+            rows,
+        )
+
+
+async def get_admin_ids(bot, chat_id: int) -> FrozenSet[int]:
+    cached = _ADMIN_SET.get(chat_id)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < ADMIN_CACHE_TTL:
+        return cached[0]
+
+    admins = await bot.get_chat_administrators(chat_id)
+    ids = frozenset(m.user.id for m in admins)
+    _ADMIN_SET[chat_id] = (ids, now)
+    return ids
+
+
+async def is_chat_admin(bot, chat_id: int, user_id: int, is_bot: bool = False) -> bool:
+    if not is_bot:
+        return user_id in await get_admin_ids(bot, chat_id)
+
+    key = (chat_id, user_id)
+    cached = _BOT_ADMIN_CACHE.get(key)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < ADMIN_CACHE_TTL:
+        return cached[0]
+
+    member = await bot.get_chat_member(chat_id, user_id)
+    result = member.status in _ADMIN_STATUSES
+    _BOT_ADMIN_CACHE[key] = (result, now)
+    return result
 
 
 async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
@@ -100,8 +419,10 @@ async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     user = update.effective_user
     if not chat or not user:
         return False
-    member = await context.bot.get_chat_member(chat.id, user.id)
-    return member.status in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+    # get_chat_administrators doesn't work in private chats, and nobody is an admin there
+    if chat.type == ChatType.PRIVATE:
+        return False
+    return await is_chat_admin(context.bot, chat.id, user.id)
 
 
 async def require_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
@@ -112,6 +433,7 @@ async def require_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> b
     return True
 
 
+@functools.lru_cache(maxsize=128)
 def parse_seconds(arg: str) -> int:
     """
     Accept:
@@ -119,22 +441,14 @@ def parse_seconds(arg: str) -> int:
       - 10m, 2h, 1d (m=minutes, h=hours, d=days)
     """
     arg = arg.strip().lower()
-    if re.fullmatch(r"\d+", arg):
+    if arg.isdigit():
         return int(arg)
 
-    m = re.fullmatch(r"(\d+)([mhd])", arg)
+    m = _RE_UNIT.fullmatch(arg)
     if not m:
         raise ValueError("bad format")
 
-    val = int(m.group(1))
-    unit = m.group(2)
-    if unit == "m":
-        return val * 60
-    if unit == "h":
-        return val * 3600
-    if unit == "d":
-        return val * 86400
-    raise ValueError("bad unit")
+    return int(m.group(1)) * _UNIT_MULT[m.group(2)]
 
 
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -154,7 +468,7 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     chat = update.effective_chat
     if not chat or not update.message:
         return
-    s = get_settings(chat.id)
+    s = await aget_settings(chat.id)
     await update.message.reply_text(
         "📌 Current settings:\n"
         f"- Enabled: {s['enabled']}\n"
@@ -182,8 +496,8 @@ async def cmd_setttl(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         return
 
     chat_id = update.effective_chat.id
-    s = get_settings(chat_id)
-    save_settings(chat_id, ttl, s["enabled"], s["delete_admins"], s["types"])
+    s = await aget_settings(chat_id)
+    await schedule_save(context, chat_id, ttl, s["enabled"], s["delete_admins"], s["types"])
     await update.message.reply_text(f"✅ TTL set to {ttl} seconds.")
 
 
@@ -193,8 +507,8 @@ async def cmd_pause(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not await require_admin(update, context):
         return
     chat_id = update.effective_chat.id
-    s = get_settings(chat_id)
-    save_settings(chat_id, s["ttl"], False, s["delete_admins"], s["types"])
+    s = await aget_settings(chat_id)
+    await schedule_save(context, chat_id, s["ttl"], False, s["delete_admins"], s["types"])
     await update.message.reply_text("⏸️ Auto-delete paused for this group.")
 
 
@@ -204,8 +518,8 @@ async def cmd_resume(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     if not await require_admin(update, context):
         return
     chat_id = update.effective_chat.id
-    s = get_settings(chat_id)
-    save_settings(chat_id, s["ttl"], True, s["delete_admins"], s["types"])
+    s = await aget_settings(chat_id)
+    await schedule_save(context, chat_id, s["ttl"], True, s["delete_admins"], s["types"])
     await update.message.reply_text("▶️ Auto-delete resumed for this group.")
 
 
@@ -219,8 +533,8 @@ async def cmd_deleteadmins(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
     val = context.args[0].lower() == "on"
     chat_id = update.effective_chat.id
-    s = get_settings(chat_id)
-    save_settings(chat_id, s["ttl"], s["enabled"], val, s["types"])
+    s = await aget_settings(chat_id)
+    await schedule_save(context, chat_id, s["ttl"], s["enabled"], val, s["types"])
     await update.message.reply_text(f"✅ Delete admins set to {val}.")
 
 
@@ -250,58 +564,114 @@ async def cmd_types(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     chat_id = update.effective_chat.id
-    s = get_settings(chat_id)
-    save_settings(chat_id, s["ttl"], s["enabled"], s["delete_admins"], types)
+    s = await aget_settings(chat_id)
+    await schedule_save(context, chat_id, s["ttl"], s["enabled"], s["delete_admins"], types)
     await update.message.reply_text(
         f"✅ Media types set: {', '.join(sorted(types)) if types else '(none)'}"
     )
 
 
-def detect_media_type(message) -> Optional[str]:
-    # ✅ Python 3.8+ compatible typing (fix for "str | None" SyntaxError on older Python)
-    if message.photo:
-        return "photo"
-    if message.video:
-        return "video"
-    if message.document:
-        return "document"
-    if message.voice:
-        return "voice"
-    if message.sticker:
-        return "sticker"
-    if message.animation:
-        return "animation"
-    if message.video_note:
-        return "video_note"
-    return None
-
-
-async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def handle_media(update: Update, context: ContextTypes.DEFAULT_TYPE, media_type: str) -> None:
     msg = update.message
     chat = update.effective_chat
     if not msg or not chat or chat.type not in ("group", "supergroup"):
         return
 
-    s = get_settings(chat.id)
+    s = await aget_settings(chat.id)
     if not s["enabled"]:
         return
 
-    media_type = detect_media_type(msg)
-    if not media_type or media_type not in s["types"]:
+    if not (s["mask"] & TYPE_BITS[media_type]):
         return
 
     # If delete_admins is False, skip deleting messages from admins/owner
     if not s["delete_admins"] and msg.from_user:
-        member = await context.bot.get_chat_member(chat.id, msg.from_user.id)
-        if member.status in (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER):
+        if await is_chat_admin(context.bot, chat.id, msg.from_user.id, msg.from_user.is_bot):
             return
 
-    await asyncio.sleep(int(s["ttl"]))
+    delete_at = int(time.time()) + int(s["ttl"])
+    await _run_blocking(add_pending_deletion, chat.id, msg.message_id, delete_at)
+
+
+async def _delete_batch(bot, chat_id: int, message_ids: List[int]) -> List[int]:
+    """
+    Delete message_ids in one call and return the ids that are finished with
+    (deleted, or can never be deleted). RetryAfter is left to the caller.
+    """
     try:
-        await msg.delete()
-    except Exception:
-        # Missing permissions / can't delete / message already gone / etc.
+        await bot.delete_messages(chat_id, message_ids)
+        return message_ids
+    except BadRequest:
+        # One undeletable id fails the whole call; retry them one by one below
         pass
+    except NetworkError:
+        # Timeout / connection trouble: retry the batch on the next sweep
+        return []
+    except RetryAfter:
+        raise
+    except Exception:
+        return message_ids
+
+    finished: List[int] = []
+    for message_id in message_ids:
+        try:
+            await bot.delete_message(chat_id, message_id)
+        except BadRequest:
+            # Missing permissions / can't delete / message already gone / etc.
+            pass
+        except NetworkError:
+            continue
+        except RetryAfter:
+            raise
+        except Exception:
+            pass
+        finished.append(message_id)
+    return finished
+
+
+async def sweep_expired(context: ContextTypes.DEFAULT_TYPE) -> None:
+    global _sweep_in_flight
+    # If the previous sweep is still talking to Telegram, leave due rows in the
+    # table; they accumulate and go out with the next sweep's batches.
+    if _sweep_in_flight:
+        return
+    _sweep_in_flight = True
+    try:
+        due = await _run_blocking(get_due_deletions, int(time.time()))
+
+        by_chat: Dict[int, List[int]] = {}
+        for chat_id, message_id in due:
+            by_chat.setdefault(chat_id, []).append(message_id)
+
+        # Rows that were deleted or can never be deleted; transient failures stay queued
+        done: List[Tuple[int, int]] = []
+        try:
+            for chat_id, message_ids in by_chat.items():
+                for i in range(0, len(message_ids), DELETE_BATCH_SIZE):
+                    finished = await _delete_batch(context.bot, chat_id, message_ids[i:i + DELETE_BATCH_SIZE])
+                    done.extend((chat_id, message_id) for message_id in finished)
+        except RetryAfter:
+            # Flood limited: stop for now, everything not yet done is retried on a later sweep
+            pass
+
+        if done:
+            await _run_blocking(remove_pending_deletions, done)
+    finally:
+        _sweep_in_flight = False
+
+
+async def maintain_db(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await _run_blocking(checkpoint_db)
+
+
+async def track_admin_changes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    cm = update.chat_member
+    if not cm:
+        return
+    # Promotions/demotions make the cached admin set stale; refetch on next use
+    if cm.old_chat_member.status in _ADMIN_STATUSES or cm.new_chat_member.status in _ADMIN_STATUSES:
+        _ADMIN_SET.pop(cm.chat.id, None)
+        _BOT_ADMIN_CACHE.pop((cm.chat.id, cm.new_chat_member.user.id), None)
 
 
 def main() -> None:
@@ -309,6 +679,15 @@ def main() -> None:
         raise RuntimeError("TOKEN env var is missing. Set TOKEN in Railway Variables.")
 
     init_db()
+    atexit.register(close_db)
+
+    # uvloop is a faster drop-in event loop; it isn't available on Windows
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        uvloop.install()
 
     app = ApplicationBuilder().token(TOKEN).build()
 
@@ -319,17 +698,26 @@ def main() -> None:
     app.add_handler(CommandHandler("resume", cmd_resume))
     app.add_handler(CommandHandler("deleteadmins", cmd_deleteadmins))
     app.add_handler(CommandHandler("types", cmd_types))
-
-    media_filter = (
-        filters.PHOTO
-        | filters.VIDEO
-        | filters.Document.ALL
-        | filters.VOICE
-        | filters.Sticker.ALL
-        | filters.ANIMATION
-        | filters.VIDEO_NOTE
+    app.add_handler(ChatMemberHandler(track_admin_changes, ChatMemberHandler.CHAT_MEMBER))
+
+    # One handler per media type so handle_media is told the type instead of
+    # re-detecting it. Only the first matching handler runs, so this order also
+    # decides the type of e.g. animations (which are documents as well).
+    media_filters = (
+        ("photo", filters.PHOTO),
+        ("video", filters.VIDEO),
+        ("document", filters.Document.ALL),
+        ("voice", filters.VOICE),
+        ("sticker", filters.Sticker.ALL),
+        ("animation", filters.ANIMATION),
+        ("video_note", filters.VIDEO_NOTE),
     )
-    app.add_handler(MessageHandler(media_filter, handle_media))
+    for media_type, media_filter in media_filters:
+        app.add_handler(MessageHandler(media_filter, functools.partial(handle_media, media_type=media_type)))
+
+    # Deletions are stored in SQLite and swept periodically, so pending ones survive restarts
+    app.job_queue.run_repeating(sweep_expired, interval=SWEEP_INTERVAL, first=SWEEP_INTERVAL)
+    app.job_queue.run_repeating(maintain_db, interval=DB_MAINTENANCE_INTERVAL, first=DB_MAINTENANCE_INTERVAL)
 
     app.run_polling(allowed_updates=Update.ALL_TYPES)
 